@@ -1,107 +1,194 @@
 """Prometheus exporter for Airflow."""
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
 from prometheus_client import REGISTRY, generate_latest
 from prometheus_client.core import GaugeMetricFamily
 
+from airflow.configuration import conf
 from airflow.models import DagModel, DagRun, TaskFail, TaskInstance
 from airflow.plugins_manager import AirflowPlugin
 from airflow.settings import Session
 from airflow.utils import timezone
 from airflow.utils.state import State
-from flask import Response
+from flask import Response, request
 from flask_admin import BaseView, expose
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, or_, select
 
 CANARY_DAG = 'canary_dag'
+QUERY_BATCH_SIZE = 1000
+CACHE_TTL = conf.getint('prometheus_exporter', 'cache_ttl', fallback=30)
+# ThreadPoolExecutor needs at least one worker; 0 or less runs queries serially.
+QUERY_WORKERS = max(
+    1, conf.getint('prometheus_exporter', 'query_workers', fallback=4)
+)
+
+
+class _ScrapeCache(object):
+    """Holds the metrics of a collector's last scrape for ``ttl`` seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # Metrics and their update time live in one tuple, so a reader
+        # without the lock never sees one without the other.
+        self._entry = None
+
+    def get(self):
+        """Return the cached metrics, or None if missing or expired."""
+        entry = self._entry
+        if entry is None:
+            return None
+        metrics, updated_at = entry
+        if time.monotonic() - updated_at >= self.ttl:
+            return None
+        return metrics
+
+    def set(self, metrics, updated_at):
+        self._entry = (metrics, updated_at)
 
 
 @contextmanager
-def session_scope(session):
-    """Provide a transactional scope around a series of operations."""
+def session_scope():
+    """Provide a transactional scope around a series of operations.
+
+    A new session is created from the factory behind Airflow's scoped
+    ``Session`` so the exporter never closes the thread-local session the
+    webserver request is using.
+    """
+    session = Session.session_factory()
     try:
         yield session
     finally:
         session.close()
 
 
+def fetch_in_batches(session, statement):
+    """Stream the rows of a Core statement in QUERY_BATCH_SIZE chunks."""
+    result = session.execute(
+        statement.execution_options(stream_results=True)
+    )
+    while True:
+        rows = result.fetchmany(QUERY_BATCH_SIZE)
+        if not rows:
+            break
+        yield from rows
+
+
+def active_dags_query():
+    """Active and unpaused DAGs, as a derived table to join against."""
+    return select([
+        DagModel.dag_id,
+        DagModel.owners,
+    ]).where(and_(
+        DagModel.is_active,
+        ~DagModel.is_paused,
+    )).alias('active_dags')
+
+
+def latest_dag_runs_query(states):
+    """Latest execution date of every active DAG in each of ``states``."""
+    active_dags = active_dags_query()
+    return select([
+        DagRun.dag_id,
+        DagRun.state,
+        func.max(DagRun.execution_date).label('max_execution_dt')
+    ]).select_from(
+        DagRun.__table__.join(
+            active_dags,
+            active_dags.c.dag_id == DagRun.dag_id,
+        )
+    ).where(and_(
+        DagRun.state.in_(states),
+        or_(DagRun.state != State.SUCCESS, DagRun.end_date.isnot(None)),
+    )).group_by(
+        DagRun.dag_id,
+        DagRun.state,
+    ).alias('max_exec')
+
+
 ######################
 # DAG Related Metrics
 ######################
 
 def get_dag_state_info():
     """Number of DAG Runs with particular state."""
-    with session_scope(Session) as session:
-        dag_status_query = session.query(
+    with session_scope() as session:
+        active_dags = active_dags_query()
+        yield from fetch_in_batches(session, select([
             DagRun.dag_id,
             DagRun.state,
-            func.count(DagRun.state).label('count')
-        ).group_by(DagRun.dag_id, DagRun.state).subquery()
-
-        return session.query(
-            dag_status_query.c.dag_id,
-            dag_status_query.c.state,
-            dag_status_query.c.count,
-            DagModel.owners
-        ).join(
-            DagModel,
-            DagModel.dag_id == dag_status_query.c.dag_id
-        ).filter(
-            DagModel.is_active == True,  # noqa
-            DagModel.is_paused == False,
-        ).all()
-
-
-def get_dag_duration_info(state):
-    """Duration of successful DAG Runs."""
-    with session_scope(Session) as session:
-        max_execution_dt_query = session.query(
-            DagRun.dag_id,
-            func.max(DagRun.execution_date).label('max_execution_dt')
-        ).join(
-            DagModel,
-            DagModel.dag_id == DagRun.dag_id
-        ).filter(
-            DagModel.is_active == True,  # noqa
-            DagModel.is_paused == False,
-            DagRun.state == state,
-            DagRun.end_date.isnot(None) if state == State.SUCCESS else True,
+            func.count().label('value'),
+            active_dags.c.owners
+        ]).select_from(
+            DagRun.__table__.join(
+                active_dags,
+                active_dags.c.dag_id == DagRun.dag_id
+            )
+        ).where(
+            DagRun.state.isnot(None)
         ).group_by(
-            DagRun.dag_id
-        ).subquery()
+            DagRun.dag_id,
+            DagRun.state,
+            active_dags.c.owners
+        ))
+
+
+def get_dag_duration_info(states=(State.RUNNING, State.SUCCESS)):
+    """Duration of the latest DAG Runs, keyed by state."""
+    with session_scope() as session:
+        max_execution_dt_query = latest_dag_runs_query(states)
 
-        dag_start_dt_query = session.query(
+        dag_start_dt_query = select([
             max_execution_dt_query.c.dag_id,
+            max_execution_dt_query.c.state,
             max_execution_dt_query.c.max_execution_dt.label('execution_date'),
             func.min(TaskInstance.start_date).label('start_date')
-        ).filter(
-            TaskInstance.start_date.isnot(None)
-        ).join(
-            TaskInstance,
-            and_(
-                TaskInstance.dag_id == max_execution_dt_query.c.dag_id,
-                (
-                    TaskInstance.execution_date ==
-                    max_execution_dt_query.c.max_execution_dt
+        ]).select_from(
+            max_execution_dt_query.join(
+                TaskInstance.__table__,
+                and_(
+                    TaskInstance.dag_id == max_execution_dt_query.c.dag_id,
+                    (
+                        TaskInstance.execution_date ==
+                        max_execution_dt_query.c.max_execution_dt
+                    )
                 )
             )
+        ).where(
+            TaskInstance.start_date.isnot(None)
         ).group_by(
             max_execution_dt_query.c.dag_id,
+            max_execution_dt_query.c.state,
             max_execution_dt_query.c.max_execution_dt,
-        ).subquery()
+        ).alias('dag_start_dt')
 
-        return session.query(
+        dag_durations_query = select([
             dag_start_dt_query.c.dag_id,
+            dag_start_dt_query.c.state,
             dag_start_dt_query.c.start_date,
             DagRun.end_date,
-        ).join(
-            DagRun,
-            and_(
-                DagRun.dag_id == dag_start_dt_query.c.dag_id,
-                DagRun.execution_date == dag_start_dt_query.c.execution_date
+        ]).select_from(
+            dag_start_dt_query.join(
+                DagRun.__table__,
+                and_(
+                    DagRun.dag_id == dag_start_dt_query.c.dag_id,
+                    (
+                        DagRun.execution_date ==
+                        dag_start_dt_query.c.execution_date
+                    )
+                )
             )
-        ).all()
+        )
+
+        dag_durations = {state: [] for state in states}
+        for dag in fetch_in_batches(session, dag_durations_query):
+            dag_durations[dag.state].append(dag)
+        return dag_durations
+
 
 ######################
 # Task Related Metrics
@@ -110,118 +197,118 @@ def get_dag_duration_info(state):
 
 def get_task_state_info():
     """Number of task instances with particular state."""
-    with session_scope(Session) as session:
-        task_status_query = session.query(
+    with session_scope() as session:
+        active_dags = active_dags_query()
+        yield from fetch_in_batches(session, select([
             TaskInstance.dag_id,
             TaskInstance.task_id,
             TaskInstance.state,
-            func.count(TaskInstance.dag_id).label('count')
+            func.count().label('value'),
+            active_dags.c.owners
+        ]).select_from(
+            TaskInstance.__table__.join(
+                active_dags,
+                active_dags.c.dag_id == TaskInstance.dag_id
+            )
         ).group_by(
             TaskInstance.dag_id,
             TaskInstance.task_id,
-            TaskInstance.state
-        ).subquery()
-
-        return session.query(
-            task_status_query.c.dag_id,
-            task_status_query.c.task_id,
-            task_status_query.c.state,
-            task_status_query.c.count,
-            DagModel.owners
-        ).join(
-            DagModel,
-            DagModel.dag_id == task_status_query.c.dag_id
-        ).filter(
-            DagModel.is_active == True,  # noqa
-            DagModel.is_paused == False,
-        ).all()
+            TaskInstance.state,
+            active_dags.c.owners
+        ).with_hint(
+            TaskInstance.__table__,
+            'USE INDEX (ti_state_lkp)',
+            dialect_name='mysql',
+        ))
 
 
 def get_task_failure_counts():
     """Compute Task Failure Counts."""
-    with session_scope(Session) as session:
-        return session.query(
+    with session_scope() as session:
+        active_dags = active_dags_query()
+        yield from fetch_in_batches(session, select([
             TaskFail.dag_id,
             TaskFail.task_id,
-            func.count(TaskFail.dag_id).label('count')
-        ).join(
-            DagModel,
-            DagModel.dag_id == TaskFail.dag_id,
-        ).filter(
-            DagModel.is_active == True,  # noqa
-            DagModel.is_paused == False,
+            func.count().label('value')
+        ]).select_from(
+            TaskFail.__table__.join(
+                active_dags,
+                active_dags.c.dag_id == TaskFail.dag_id,
+            )
         ).group_by(
             TaskFail.dag_id,
             TaskFail.task_id,
-        )
+        ))
 
 
-def get_task_duration_info(state):
-    """Duration of successful tasks in seconds."""
-    with session_scope(Session) as session:
-        max_execution_dt_query = session.query(
-            DagRun.dag_id,
-            func.max(DagRun.execution_date).label('max_execution_dt')
-        ).join(
-            DagModel,
-            DagModel.dag_id == DagRun.dag_id,
-        ).filter(
-            DagModel.is_active == True,  # noqa
-            DagModel.is_paused == False,
-            DagRun.state == state,
-            DagRun.end_date.isnot(None) if state == State.SUCCESS else True,
-        ).group_by(
-            DagRun.dag_id
-        ).subquery()
+def get_task_duration_info(states=(State.RUNNING, State.SUCCESS)):
+    """Duration of the latest task instances, keyed by state."""
+    with session_scope() as session:
+        max_execution_dt_query = latest_dag_runs_query(states)
 
-        task_duration_query = session.query(
+        # Latest task instance per task and state, in a single pass over
+        # task_instance instead of a GROUP BY joined back to itself.
+        latest_task_query = select([
             TaskInstance.dag_id,
             TaskInstance.task_id,
-            func.max(TaskInstance.execution_date).label('max_execution_dt')
-        ).filter(
-            TaskInstance.state == state,
-            TaskInstance.start_date.isnot(None),
-            TaskInstance.end_date.isnot(None) if state == State.SUCCESS else True,
-        ).group_by(
-            TaskInstance.dag_id,
-            TaskInstance.task_id
-        ).subquery()
-
-        task_latest_execution_dt = session.query(
-            task_duration_query.c.dag_id,
-            task_duration_query.c.task_id,
-            task_duration_query.c.max_execution_dt.label('execution_date'),
-        ).join(
-            max_execution_dt_query,
-            and_(
-                (
-                    task_duration_query.c.dag_id ==
-                    max_execution_dt_query.c.dag_id
-                ),
-                (
-                    task_duration_query.c.max_execution_dt ==
-                    max_execution_dt_query.c.max_execution_dt
-                ),
-            )
-        ).subquery()
-
-        return session.query(
-            task_latest_execution_dt.c.dag_id,
-            task_latest_execution_dt.c.task_id,
+            TaskInstance.state,
             TaskInstance.start_date,
             TaskInstance.end_date,
-            task_latest_execution_dt.c.execution_date,
-        ).join(
-            TaskInstance,
-            and_(
-                TaskInstance.dag_id == task_latest_execution_dt.c.dag_id,
-                TaskInstance.task_id == task_latest_execution_dt.c.task_id,
-                (
-                    TaskInstance.execution_date ==
-                    task_latest_execution_dt.c.execution_date
-                ),
+            TaskInstance.execution_date,
+            func.row_number().over(
+                partition_by=[
+                    TaskInstance.dag_id,
+                    TaskInstance.task_id,
+                    TaskInstance.state,
+                ],
+                order_by=TaskInstance.execution_date.desc(),
+            ).label('rn'),
+        ]).where(and_(
+            TaskInstance.state.in_(states),
+            TaskInstance.start_date.isnot(None),
+            or_(
+                TaskInstance.state != State.SUCCESS,
+                TaskInstance.end_date.isnot(None),
+            ),
+        )).with_hint(
+            TaskInstance.__table__,
+            'USE INDEX (ti_state_lkp)',
+            dialect_name='mysql',
+        ).alias('latest_task')
+
+        task_durations_query = select([
+            latest_task_query.c.dag_id,
+            latest_task_query.c.task_id,
+            latest_task_query.c.state,
+            latest_task_query.c.start_date,
+            latest_task_query.c.end_date,
+            latest_task_query.c.execution_date,
+        ]).select_from(
+            latest_task_query.join(
+                max_execution_dt_query,
+                and_(
+                    (
+                        latest_task_query.c.dag_id ==
+                        max_execution_dt_query.c.dag_id
+                    ),
+                    (
+                        latest_task_query.c.state ==
+                        max_execution_dt_query.c.state
+                    ),
+                    (
+                        latest_task_query.c.execution_date ==
+                        max_execution_dt_query.c.max_execution_dt
+                    ),
+                )
             )
-        ).all()
+        ).where(
+            latest_task_query.c.rn == 1
+        )
+
+        task_durations = {state: [] for state in states}
+        for task in fetch_in_batches(session, task_durations_query):
+            task_durations[task.state].append(task)
+        return task_durations
 
 ######################
 # Scheduler Related Metrics
@@ -230,199 +317,307 @@ def get_task_duration_info(state):
 
 def get_dag_scheduler_delay():
     """Compute DAG scheduling delay."""
-    with session_scope(Session) as session:
-        return session.query(
+    with session_scope() as session:
+        return session.execute(select([
             DagRun.dag_id,
             DagRun.execution_date,
             DagRun.start_date,
-        ).filter(
+        ]).where(
             DagRun.dag_id == CANARY_DAG,
         ).order_by(
             DagRun.execution_date.desc()
-        ).limit(1).all()
+        ).limit(1)).fetchall()
 
 
 def get_task_scheduler_delay():
     """Compute Task scheduling delay."""
-    with session_scope(Session) as session:
-        task_status_query = session.query(
+    with session_scope() as session:
+        task_status_query = select([
             TaskInstance.queue,
             func.max(TaskInstance.start_date).label('max_start'),
-        ).filter(
+        ]).where(and_(
             TaskInstance.dag_id == CANARY_DAG,
             TaskInstance.queued_dttm.isnot(None),
-        ).group_by(
+        )).group_by(
             TaskInstance.queue
-        ).subquery()
+        ).alias('task_status')
 
-        return session.query(
+        return session.execute(select([
             task_status_query.c.queue,
             TaskInstance.execution_date,
             TaskInstance.queued_dttm,
             task_status_query.c.max_start.label('start_date'),
-        ).join(
-            TaskInstance,
-            and_(
-                TaskInstance.queue == task_status_query.c.queue,
-                TaskInstance.start_date == task_status_query.c.max_start,
+        ]).select_from(
+            task_status_query.join(
+                TaskInstance.__table__,
+                and_(
+                    TaskInstance.queue == task_status_query.c.queue,
+                    TaskInstance.start_date == task_status_query.c.max_start,
+                )
             )
-        ).all()
+        )).fetchall()
 
 
 def get_num_queued_tasks():
     """Number of queued tasks currently."""
-    with session_scope(Session) as session:
-        return session.query(
-            TaskInstance
-        ).filter(
+    with session_scope() as session:
+        return session.execute(select([
+            func.count()
+        ]).select_from(
+            TaskInstance.__table__
+        ).where(
             TaskInstance.state == State.QUEUED
-        ).count()
+        )).scalar()
+
+
+class _ExecutionDateLabels(dict):
+    """Execution date labels, formatted once per distinct execution date.
+
+    Many tasks share an execution date, so a scrape formats far fewer
+    labels than it has rows.
+    """
+
+    def __missing__(self, execution_date):
+        label = self[execution_date] = execution_date.date().isoformat()
+        return label
 
 
 class MetricsCollector(object):
-    """Metrics Collector for prometheus."""
+    """Base collector for the metric families built from one query.
+
+    Every subclass is registered on its own, so a scrape filtered with
+    ``name[]`` only runs the queries behind the requested families.
+    """
+
+    def __init__(self):
+        self._cache = _ScrapeCache(CACHE_TTL)
+        # Metrics prefetched for the scrape running on the current thread.
+        self._prefetched = threading.local()
+        self.names = {metric.name for metric in self.describe()}
 
     def describe(self):
-        return []
+        return self.new_metrics()
 
     def collect(self):
-        """Collect metrics."""
-        utc_now = timezone.utcnow()
+        """Collect metrics, reusing prefetched or still fresh results."""
+        metrics = getattr(self._prefetched, 'metrics', None)
+        if metrics is not None:
+            self._prefetched.metrics = None
+            return metrics
+
+        metrics = self._cache.get()
+        if metrics is None:
+            # Concurrent scrapes wait for a single rebuild instead of all
+            # hitting the database at once.
+            with self._cache.lock:
+                metrics = self._cache.get()
+                if metrics is None:
+                    metrics = self.new_metrics()
+                    self.add_metrics(*metrics)
+                    self._cache.set(metrics, time.monotonic())
+        return metrics
+
+    def prefetched(self, metrics):
+        """Serve ``metrics`` to the next ``collect()`` on this thread."""
+        self._prefetched.metrics = metrics
+
+    def new_metrics(self):
+        """Return the empty metric families exported by this collector."""
+        raise NotImplementedError
+
+    def add_metrics(self, *metrics):
+        """Query the metadata database and fill in ``metrics``."""
+        raise NotImplementedError
 
-        # Task metrics
-        t_state = GaugeMetricFamily(
+
+######################
+# Task Related Collectors
+######################
+
+
+class TaskStatusCollector(MetricsCollector):
+    """Number of task instances per status."""
+
+    def new_metrics(self):
+        return [GaugeMetricFamily(
             'airflow_task_status',
-            'Shows the number of task instances with particular status',
+            'Shows the number of task instances with particular status, '
+            'statuses without task instances are omitted',
             labels=['dag_id', 'task_id', 'owner', 'status']
-        )
+        )]
 
+    def add_metrics(self, t_state):
         tasks_info_by_id = {}
         for task in get_task_state_info():
-            task_uid = f'{task.dag_id}_{task.task_id}'
+            task_uid = (task.dag_id, task.task_id)
             task_info = tasks_info_by_id.setdefault(task_uid, {
                 'meta': task,
                 'state_count': {}
             })
             state = task.state or 'none'
-            task_info['state_count'][state] = task.count
+            task_info['state_count'][state] = task.value
 
         for task_info in tasks_info_by_id.values():
             task = task_info['meta']
-            for state in State.task_states:
-                state = state or 'none'
+            for state, count in task_info['state_count'].items():
                 t_state.add_metric(
                     [task.dag_id, task.task_id, task.owners, state],
-                    task_info['state_count'].get(state, 0)
+                    count
                 )
 
-        yield t_state
 
-        task_duration = GaugeMetricFamily(
-            'airflow_task_duration',
-            'Duration of running tasks in seconds',
-            labels=['task_id', 'dag_id', 'execution_date']
-        )
-
-        for task in get_task_duration_info(State.RUNNING):
-            task_duration_value = (utc_now - task.start_date).total_seconds()
+class TaskDurationCollector(MetricsCollector):
+    """Duration of running tasks and time since the last task success."""
+
+    def new_metrics(self):
+        return [
+            GaugeMetricFamily(
+                'airflow_task_duration',
+                'Duration of running tasks in seconds',
+                labels=['task_id', 'dag_id', 'execution_date']
+            ),
+            GaugeMetricFamily(
+                'airflow_last_task_success_time',
+                'Elapsed time in seconds since last task success',
+                labels=['task_id', 'dag_id', 'execution_date']
+            ),
+        ]
+
+    def add_metrics(self, task_duration, last_task_success_time):
+        # Durations are computed as float differences of POSIX timestamps,
+        # which avoids building a timedelta for every row.
+        utc_now_ts = timezone.utcnow().timestamp()
+        task_durations = get_task_duration_info()
+
+        execution_date_labels = _ExecutionDateLabels()
+
+        for task in task_durations[State.RUNNING]:
+            task_duration_value = utc_now_ts - task.start_date.timestamp()
             task_duration.add_metric(
-                [task.task_id, task.dag_id, str(task.execution_date.date())],
+                [
+                    task.task_id,
+                    task.dag_id,
+                    execution_date_labels[task.execution_date],
+                ],
                 task_duration_value
             )
 
-        yield task_duration
-
-        last_task_success_time = GaugeMetricFamily(
-            'airflow_last_task_success_time',
-            'Elapsed time in seconds since last task success',
-            labels=['task_id', 'dag_id', 'execution_date']
-        )
-
-        for task in get_task_duration_info(State.SUCCESS):
-            last_task_success_time_value = (utc_now - task.end_date).total_seconds()
+        for task in task_durations[State.SUCCESS]:
+            last_task_success_time_value = utc_now_ts - task.end_date.timestamp()
             last_task_success_time.add_metric(
-                [task.task_id, task.dag_id, str(task.execution_date.date())],
+                [
+                    task.task_id,
+                    task.dag_id,
+                    execution_date_labels[task.execution_date],
+                ],
                 last_task_success_time_value
             )
 
-        yield last_task_success_time
 
-        task_failure_count = GaugeMetricFamily(
+class TaskFailureCollector(MetricsCollector):
+    """Number of failures per task."""
+
+    def new_metrics(self):
+        return [GaugeMetricFamily(
             'airflow_task_fail_count',
             'Count of failed tasks',
             labels=['dag_id', 'task_id']
-        )
+        )]
 
+    def add_metrics(self, task_failure_count):
         for task in get_task_failure_counts():
             task_failure_count.add_metric(
                 [task.dag_id, task.task_id],
-                task.count
+                task.value
             )
 
-        yield task_failure_count
 
-        # Dag Metrics
-        d_state = GaugeMetricFamily(
+######################
+# DAG Related Collectors
+######################
+
+
+class DagStatusCollector(MetricsCollector):
+    """Number of DAG Runs per status."""
+
+    def new_metrics(self):
+        return [GaugeMetricFamily(
             'airflow_dag_status',
-            'Shows the number of dag starts with this status',
+            'Shows the number of dag starts with this status, '
+            'statuses without dag runs are omitted',
             labels=['dag_id', 'owner', 'status']
-        )
+        )]
 
+    def add_metrics(self, d_state):
         dags_info_by_id = {}
         for dag in get_dag_state_info():
             dag_info = dags_info_by_id.setdefault(dag.dag_id, {
                 'meta': dag,
                 'state_count': {}
             })
-            dag_info['state_count'][dag.state] = dag.count
+            dag_info['state_count'][dag.state] = dag.value
 
         for dag_info in dags_info_by_id.values():
             dag = dag_info['meta']
-            for state in State.dag_states:
+            for state, count in dag_info['state_count'].items():
                 d_state.add_metric(
                     [dag.dag_id, dag.owners, state],
-                    dag_info['state_count'].get(state, 0)
+                    count
                 )
 
-        yield d_state
-
-        dag_duration = GaugeMetricFamily(
-            'airflow_dag_run_duration',
-            'Duration of running dag_runs in seconds',
-            labels=['dag_id']
-        )
 
-        for dag in get_dag_duration_info(State.RUNNING):
-            dag_duration_value = (utc_now - dag.start_date).total_seconds()
+class DagDurationCollector(MetricsCollector):
+    """Duration of running DAG Runs and time since the last DAG success."""
+
+    def new_metrics(self):
+        return [
+            GaugeMetricFamily(
+                'airflow_dag_run_duration',
+                'Duration of running dag_runs in seconds',
+                labels=['dag_id']
+            ),
+            GaugeMetricFamily(
+                'airflow_last_dag_success_time',
+                'Elapsed time in seconds since last DAG success',
+                labels=['dag_id']
+            ),
+        ]
+
+    def add_metrics(self, dag_duration, last_dag_success_time):
+        utc_now_ts = timezone.utcnow().timestamp()
+        dag_durations = get_dag_duration_info()
+
+        for dag in dag_durations[State.RUNNING]:
+            dag_duration_value = utc_now_ts - dag.start_date.timestamp()
             dag_duration.add_metric(
                 [dag.dag_id],
                 dag_duration_value
             )
 
-        yield dag_duration
-
-        last_dag_success_time = GaugeMetricFamily(
-            'airflow_last_dag_success_time',
-            'Elapsed time in seconds since last DAG success',
-            labels=['dag_id']
-        )
-
-        for dag in get_dag_duration_info(State.SUCCESS):
-            last_dag_success_time_value = (utc_now - dag.end_date).total_seconds()
+        for dag in dag_durations[State.SUCCESS]:
+            last_dag_success_time_value = utc_now_ts - dag.end_date.timestamp()
             last_dag_success_time.add_metric(
                 [dag.dag_id],
                 last_dag_success_time_value
             )
 
-        yield last_dag_success_time
 
-        # Scheduler Metrics
-        dag_scheduler_delay = GaugeMetricFamily(
+######################
+# Scheduler Related Collectors
+######################
+
+
+class DagSchedulerDelayCollector(MetricsCollector):
+    """Scheduling delay of the canary DAG."""
+
+    def new_metrics(self):
+        return [GaugeMetricFamily(
             'airflow_dag_scheduler_delay',
             'Airflow DAG scheduling delay',
             labels=['dag_id']
-        )
+        )]
 
+    def add_metrics(self, dag_scheduler_delay):
         for dag in get_dag_scheduler_delay():
             dag_scheduling_delay_value = (dag.start_date - dag.execution_date).total_seconds()
             dag_scheduler_delay.add_metric(
@@ -430,14 +625,18 @@ class MetricsCollector(object):
                 dag_scheduling_delay_value
             )
 
-        yield dag_scheduler_delay
 
-        task_scheduler_delay = GaugeMetricFamily(
+class TaskSchedulerDelayCollector(MetricsCollector):
+    """Scheduling delay of the canary DAG tasks per queue."""
+
+    def new_metrics(self):
+        return [GaugeMetricFamily(
             'airflow_task_scheduler_delay',
             'Airflow Task scheduling delay',
             labels=['queue']
-        )
+        )]
 
+    def add_metrics(self, task_scheduler_delay):
         for task in get_task_scheduler_delay():
             task_scheduling_delay_value = (
                 task.start_date - task.queued_dttm).total_seconds()
@@ -446,26 +645,72 @@ class MetricsCollector(object):
                 task_scheduling_delay_value
             )
 
-        yield task_scheduler_delay
 
-        num_queued_tasks_metric = GaugeMetricFamily(
+class QueuedTasksCollector(MetricsCollector):
+    """Number of queued tasks."""
+
+    def new_metrics(self):
+        return [GaugeMetricFamily(
             'airflow_num_queued_tasks',
             'Airflow Number of Queued Tasks',
-        )
+        )]
+
+    def add_metrics(self, num_queued_tasks_metric):
+        num_queued_tasks_metric.add_metric([], get_num_queued_tasks())
 
-        num_queued_tasks = get_num_queued_tasks()
-        num_queued_tasks_metric.add_metric([], num_queued_tasks)
 
-        yield num_queued_tasks_metric
+COLLECTORS = [
+    TaskStatusCollector(),
+    TaskDurationCollector(),
+    TaskFailureCollector(),
+    DagStatusCollector(),
+    DagDurationCollector(),
+    DagSchedulerDelayCollector(),
+    TaskSchedulerDelayCollector(),
+    QueuedTasksCollector(),
+]
 
+for collector in COLLECTORS:
+    REGISTRY.register(collector)
 
-REGISTRY.register(MetricsCollector())
+
+@contextmanager
+def prefetch_metrics(names=None):
+    """Run the queries of the requested collectors concurrently.
+
+    The results are handed to each collector for the current thread only,
+    so the sequential ``collect()`` calls made by ``generate_latest()``
+    inside this scope need no further queries, whether or not caching is
+    enabled.
+    """
+    collectors = [
+        collector for collector in COLLECTORS
+        if not names or collector.names.intersection(names)
+    ]
+    # Each query runs on its own session, see session_scope().
+    with ThreadPoolExecutor(max_workers=QUERY_WORKERS) as pool:
+        results = list(pool.map(MetricsCollector.collect, collectors))
+    for collector, metrics in zip(collectors, results):
+        collector.prefetched(metrics)
+    try:
+        yield
+    finally:
+        for collector in collectors:
+            collector.prefetched(None)
 
 
 class Metrics(BaseView):
     @expose('/')
     def index(self):
-        return Response(generate_latest(), mimetype='text/plain')
+        names = request.args.getlist('name[]')
+        with prefetch_metrics(names):
+            # Older prometheus_client versions collect as soon as the
+            # restricted registry is built, so it must happen in this scope.
+            registry = (
+                REGISTRY.restricted_registry(names) if names else REGISTRY
+            )
+            output = generate_latest(registry)
+        return Response(output, mimetype='text/plain')
 
 
 ADMIN_VIEW = Metrics(category='Prometheus exporter', name='metrics')
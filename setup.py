@@ -16,6 +16,7 @@ install_requirements = [
 extras_require={
     'dev': [
         'bumpversion',
+        'pytest',
         'tox',
         'twine',
     ]
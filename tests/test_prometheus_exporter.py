@@ -0,0 +1,61 @@
+"""Tests for the Prometheus exporter."""
+
+import os
+import unittest
+
+# Scrapes must hit the database every time for queries to be counted.
+os.environ['AIRFLOW__PROMETHEUS_EXPORTER__CACHE_TTL'] = '0'
+
+from airflow.settings import engine  # noqa: E402
+from airflow.utils import db  # noqa: E402
+from flask import Flask  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from airflow_prometheus_exporter.prometheus_exporter import (  # noqa: E402
+    ADMIN_VIEW,
+)
+
+
+class FilteredScrapeTest(unittest.TestCase):
+    """A scrape filtered with ``name[]`` runs each needed query once."""
+
+    @classmethod
+    def setUpClass(cls):
+        db.initdb()
+
+    def setUp(self):
+        self.statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+        self.count_statement = count_statement
+        event.listen(engine, 'before_cursor_execute', count_statement)
+
+    def tearDown(self):
+        event.remove(engine, 'before_cursor_execute', self.count_statement)
+
+    def scrape(self, query_string):
+        with Flask(__name__).test_request_context('/?' + query_string):
+            return ADMIN_VIEW.index().get_data(as_text=True)
+
+    def test_single_family(self):
+        output = self.scrape('name[]=airflow_dag_status')
+
+        self.assertIn('# TYPE airflow_dag_status gauge', output)
+        self.assertNotIn('airflow_task_status', output)
+        self.assertEqual(len(self.statements), 1)
+
+    def test_families_sharing_a_query(self):
+        output = self.scrape(
+            'name[]=airflow_dag_run_duration'
+            '&name[]=airflow_last_dag_success_time'
+        )
+
+        self.assertIn('# TYPE airflow_dag_run_duration gauge', output)
+        self.assertIn('# TYPE airflow_last_dag_success_time gauge', output)
+        self.assertEqual(len(self.statements), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()